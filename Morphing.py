@@ -1,12 +1,40 @@
 import numpy as np
-from scipy.spatial import Delaunay
-from scipy.interpolate import interpn
-from scipy.sparse import find
-import imageio as io
-from PIL import Image, ImageDraw
 
 import os
 import time
+import heapq
+import importlib
+import importlib.util
+import subprocess
+from itertools import islice
+from collections import OrderedDict, deque
+
+class _LazyModule():
+
+    # Stands in for a module until an attribute is first used -- keeps scipy, PIL and imageio out of startup
+    def __init__(self, name):
+
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+
+        return getattr(self._module, attribute)
+
+spatial = _LazyModule('scipy.spatial')
+interpolate = _LazyModule('scipy.interpolate')
+sparse = _LazyModule('scipy.sparse')
+ndimage = _LazyModule('scipy.ndimage')
+io = _LazyModule('imageio')
+Image = _LazyModule('PIL.Image')
+ImageDraw = _LazyModule('PIL.ImageDraw')
+futures = _LazyModule('concurrent.futures')
+
+# OpenCV is optional -- its warp backend is only offered when it is installed
+cv2 = _LazyModule('cv2')
 
 class Affine():
 
@@ -33,12 +61,12 @@ class Affine():
         mask = self._Mask(destinationImage)
 
         # Find indicies to place data at
-        sparse = find(mask)
+        indices = sparse.find(mask)
 
         # Use inverse matrix -- then use interpolation and assign to destination at this point
-        destArray = np.array([sparse[1],
-                              sparse[0],
-                              np.full(sparse[1].shape, 1)])
+        destArray = np.array([indices[1],
+                              indices[0],
+                              np.full(indices[1].shape, 1)])
 
         # Unpack result
         result = np.matmul(self.inverseMatrix, destArray)
@@ -49,11 +77,11 @@ class Affine():
         # Interpolate
         points = (np.arange(sourceImage.shape[0]), np.arange(sourceImage.shape[1]))
         #print(points)
-        results = interpn(points=points, values=sourceImage, xi=valuePoints, bounds_error=False)
+        results = interpolate.interpn(points=points, values=sourceImage, xi=valuePoints, bounds_error=False)
 
         # Assign to output
-        # print(np.nan in sparse[1])
-        destinationImage[sparse[0], sparse[1]] = np.round([item for item in results])
+        # print(np.nan in indices[1])
+        destinationImage[indices[0], indices[1]] = np.round([item for item in results])
 
     # Method to create a mask of this image
     def _Mask(self, destinationImage):
@@ -107,9 +135,376 @@ class Affine():
 
 
 
+class WarpBackend():
+
+    name = None
+
+    # Only backends within one intensity level of the reference are considered by 'auto' -- 'fastest' times every backend
+    autoSelect = False
+
+    @classmethod
+    def isAvailable(cls):
+
+        return True
+
+    def warp(self, sourceImage, sourcePoints, targetPoints, simplices, destinationImage):
+
+        # Fill every target triangle of destinationImage with the matching source triangle
+        raise NotImplementedError("Warp backends must implement warp.")
+
+
+
+class ReferenceBackend(WarpBackend):
+
+    name = 'reference'
+
+    def warp(self, sourceImage, sourcePoints, targetPoints, simplices, destinationImage):
+
+        # One polygon mask and interpolation over the whole image per triangle
+        for tri in simplices:
+            Affine(sourcePoints[tri].astype(np.float64), targetPoints[tri].astype(np.float64)).transform(sourceImage, destinationImage)
+
+
+
+class MapCoordinatesBackend(WarpBackend):
+
+    name = 'map_coordinates'
+    autoSelect = True
+
+    def warp(self, sourceImage, sourcePoints, targetPoints, simplices, destinationImage):
+
+        height = destinationImage.shape[0]
+        width = destinationImage.shape[1]
+
+        # Label every pixel with its triangle -- drawn in the same order so shared edges match the reference
+        labels = Image.new('I', (width, height), 0)
+        draw = ImageDraw.Draw(labels)
+        for i, tri in enumerate(simplices):
+            vertices = [(targetPoints[j, 0], targetPoints[j, 1]) for j in tri]
+            draw.polygon(vertices, outline=i + 1, fill=i + 1)
+
+        labels = np.array(labels) - 1
+        rows, columns = np.nonzero(labels >= 0)
+        triangles = labels[rows, columns]
+
+        # Inverse affine matrices for all triangles, then gathered per pixel
+        inverse = _InverseMatrices(sourcePoints, targetPoints, simplices)[triangles]
+        sourceX = inverse[:, 0, 0] * columns + inverse[:, 0, 1] * rows + inverse[:, 0, 2]
+        sourceY = inverse[:, 1, 0] * columns + inverse[:, 1, 1] * rows + inverse[:, 1, 2]
+
+        # Bilinear sampling matches interpn's linear method
+        if len(sourceImage.shape) == 3:
+            for channel in range(sourceImage.shape[2]):
+                values = ndimage.map_coordinates(sourceImage[:, :, channel], [sourceY, sourceX], output=np.float64, order=1, mode='constant', cval=0.0)
+                destinationImage[rows, columns, channel] = np.round(values)
+        else:
+            values = ndimage.map_coordinates(sourceImage, [sourceY, sourceX], output=np.float64, order=1, mode='constant', cval=0.0)
+            destinationImage[rows, columns] = np.round(values)
+
+
+
+class OpenCVBackend(WarpBackend):
+
+    name = 'opencv'
+
+    @classmethod
+    def isAvailable(cls):
+
+        return importlib.util.find_spec('cv2') is not None
+
+    def warp(self, sourceImage, sourcePoints, targetPoints, simplices, destinationImage):
+
+        height = destinationImage.shape[0]
+        width = destinationImage.shape[1]
+
+        for tri in simplices:
+            source = sourcePoints[tri].astype(np.float32)
+            target = targetPoints[tri].astype(np.float32)
+
+            # Only warp the bounding box of the target triangle
+            x, y, w, h = cv2.boundingRect(target)
+            left, top = max(x, 0), max(y, 0)
+            right, bottom = min(x + w, width), min(y + h, height)
+            if right <= left or bottom <= top:
+                continue
+
+            offset = np.array([left, top], np.float32)
+            matrix = cv2.getAffineTransform(source, target - offset)
+            patch = cv2.warpAffine(sourceImage, matrix, (right - left, bottom - top), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+            mask = np.zeros((bottom - top, right - left), np.uint8)
+            cv2.fillConvexPoly(mask, np.round(target - offset).astype(np.int32), 1)
+            mask = mask.astype(bool)
+
+            destinationImage[top:bottom, left:right][mask] = patch[mask]
+
+
+
+# Registered backends by name -- selection only considers the ones that are available
+warpBackends = OrderedDict((backend.name, backend) for backend in (ReferenceBackend, MapCoordinatesBackend, OpenCVBackend))
+
+# Backends picked by the micro-benchmark keyed by image size, channel and triangle count buckets
+_selectedBackends = {}
+
+def GetWarpBackend(backend, imageShape, triangleCount):
+
+    # Default can be overridden from the environment, e.g. MORPHING_BACKEND=reference
+    if backend is None:
+        backend = os.environ.get('MORPHING_BACKEND', 'auto')
+
+    if isinstance(backend, WarpBackend):
+        return backend
+    elif backend in ('auto', 'fastest'):
+        return SelectWarpBackend(imageShape, triangleCount, exact=(backend == 'auto'))
+    elif backend not in warpBackends:
+        raise ValueError("Unknown warp backend '{}', expected one of: auto, fastest, {}.".format(backend, ', '.join(warpBackends)))
+    elif not warpBackends[backend].isAvailable():
+        raise ValueError("Warp backend '{}' is not available.".format(backend))
+
+    return warpBackends[backend]()
+
+def SelectWarpBackend(imageShape, triangleCount, exact = True, maxPixels = 65536, maxTriangles = 256, repeats = 2):
+
+    # Exact selection keeps to backends close to the reference -- otherwise lower quality ones like opencv compete too.
+    # Reference is never timed since it can't win.
+    candidates = [backendType for backendType in warpBackends.values()
+                  if backendType is not ReferenceBackend and (backendType.autoSelect or not exact) and backendType.isAvailable()]
+    if len(candidates) == 1:
+        return candidates[0]()
+
+    # Nearby sizes share a decision -- buckets are powers of two
+    height, width = imageShape[0], imageShape[1]
+    channels = imageShape[2] if len(imageShape) == 3 else 1
+    triangleCount = min(triangleCount, maxTriangles)
+    key = (exact, int(np.log2(max(height * width, 1))), channels, int(np.log2(max(triangleCount, 1))))
+
+    if key in _selectedBackends:
+        return _selectedBackends[key]
+
+    # Benchmark on a proxy no larger than maxPixels with a grid of roughly triangleCount triangles
+    scale = min(1.0, np.sqrt(maxPixels / float(height * width)))
+    height, width = max(int(height * scale), 8), max(int(width * scale), 8)
+    shape = (height, width, channels) if channels > 1 else (height, width)
+
+    random = np.random.RandomState(0)
+    image = random.randint(0, 256, size=shape).astype(np.uint8)
+
+    cells = max(int(np.ceil(np.sqrt(triangleCount / 2.0))), 1)
+    gridX, gridY = np.meshgrid(np.linspace(0, width - 1, cells + 1), np.linspace(0, height - 1, cells + 1))
+    sourcePoints = np.stack([gridX.ravel(), gridY.ravel()], axis=1)
+    targetPoints = sourcePoints.copy()
+    targetPoints[:, 0] += random.uniform(-0.2, 0.2, len(targetPoints)) * (width - 1) / cells
+    targetPoints[:, 1] += random.uniform(-0.2, 0.2, len(targetPoints)) * (height - 1) / cells
+    simplices = spatial.Delaunay(sourcePoints).simplices
+
+    timings = OrderedDict()
+    for backendType in candidates:
+        backend = backendType()
+        best = None
+        for _ in range(repeats):
+            destination = np.zeros(shape, np.uint8)
+            start = time.perf_counter()
+            backend.warp(image, sourcePoints, targetPoints, simplices, destination)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        timings[backendType.name] = (best, backend)
+
+    _selectedBackends[key] = min(timings.values(), key=lambda timing: timing[0])[1]
+    return _selectedBackends[key]
+
+def _InverseMatrices(sourcePoints, targetPoints, simplices):
+
+    # Homogeneous vertex matrices -- columns are the triangle vertices
+    source = np.concatenate([np.transpose(sourcePoints[simplices], (0, 2, 1)), np.ones((len(simplices), 1, 3))], axis=1)
+    target = np.concatenate([np.transpose(targetPoints[simplices], (0, 2, 1)), np.ones((len(simplices), 1, 3))], axis=1)
+
+    # inverse @ target = source, solved as target^T @ inverse^T = source^T -- degenerate targets fall back to the pseudo inverse
+    try:
+        inverse = np.transpose(np.linalg.solve(np.transpose(target, (0, 2, 1)), np.transpose(source, (0, 2, 1))), (0, 2, 1))
+    except np.linalg.LinAlgError:
+        inverse = np.matmul(source, np.linalg.pinv(target))
+
+    return inverse[:, :2, :]
+
+
+
+# Easing curves map uniform time in [0, 1] to alpha in [0, 1]
+easingCurves = OrderedDict([('linear', lambda t: t),
+                            ('ease-in', lambda t: t * t),
+                            ('ease-out', lambda t: 1.0 - (1.0 - t) * (1.0 - t)),
+                            ('ease-in-out', lambda t: t * t * (3.0 - 2.0 * t)),
+                            ('sine', lambda t: 0.5 - 0.5 * np.cos(np.pi * t))])
+
+
+def _MipLevel(levels, size):
+
+    # Halve until the next level would be smaller than the output -- levels are kept for later frames
+    index = 0
+    while (levels[index].shape[1] + 1) // 2 >= size[0] and (levels[index].shape[0] + 1) // 2 >= size[1] and min(levels[index].shape[:2]) > 1:
+        if index + 1 == len(levels):
+            levels.append(np.array(Image.fromarray(levels[index]).reduce(2)))
+        index += 1
+
+    return levels[index]
+
+def _ScalePoints(points, image, size):
+
+    # Map pixel centres from the image onto an image of size (width, height)
+    factor = np.array([size[0] / float(image.shape[1]), size[1] / float(image.shape[0])])
+    if (factor == 1.0).all():
+        return points
+
+    return (points + 0.5) * factor - 0.5
+
+def _ResizeImage(image, size):
+
+    if (image.shape[1], image.shape[0]) == tuple(size):
+        return image
+
+    return np.array(Image.fromarray(image).resize(size, Image.BILINEAR))
+
+
+
+class CorrespondenceReport():
+
+    def __init__(self):
+
+        # Lists of (code, message) tuples -- errors are empty when the correspondences can be rendered
+        self.errors = []
+        self.warnings = []
+        self.simplices = None
+        self.duplicateStartPoints = np.empty(0, np.intp)
+        self.duplicateEndPoints = np.empty(0, np.intp)
+        self.degenerateTriangles = np.empty(0, np.intp)
+        self.foldedTriangles = np.empty(0, np.intp)
+        self.foldAlphas = np.empty(0, np.float64)
+
+    @property
+    def isValid(self):
+
+        return len(self.errors) == 0
+
+    def __str__(self):
+
+        if self.isValid and not self.warnings:
+            return "Correspondences are valid."
+
+        return '\n'.join(message for _, message in self.errors + self.warnings)
+
+
+
+def ValidateCorrespondences(startPoints, endPoints, simplices = None, tolerance = 1e-6, allowFolds = False):
+
+    report = CorrespondenceReport()
+
+    if type(startPoints) is not np.ndarray or type(endPoints) is not np.ndarray:
+        report.errors.append(('type', "Point inputs are not numpy arrays."))
+        return report
+    elif startPoints.ndim != 2 or startPoints.shape[1:] != (2,) or endPoints.ndim != 2 or endPoints.shape[1:] != (2,):
+        report.errors.append(('shape', "Point arrays must be Nx2."))
+        return report
+    elif startPoints.shape[0] != endPoints.shape[0]:
+        report.errors.append(('count', "Mismatched point counts: {} start points and {} end points.".format(startPoints.shape[0], endPoints.shape[0])))
+        return report
+    elif startPoints.shape[0] < 3:
+        report.errors.append(('count', "At least 3 point pairs are needed, found {}.".format(startPoints.shape[0])))
+        return report
+    elif not np.isfinite(startPoints).all() or not np.isfinite(endPoints).all():
+        report.errors.append(('finite', "Points contain NaN or infinite values."))
+        return report
+
+    # Points repeated within either image collapse triangles onto each other
+    report.duplicateStartPoints = _DuplicateIndices(startPoints)
+    report.duplicateEndPoints = _DuplicateIndices(endPoints)
+
+    if report.duplicateStartPoints.size:
+        report.errors.append(('duplicate', "Duplicate start points at indices {}.".format(report.duplicateStartPoints.tolist())))
+    if report.duplicateEndPoints.size:
+        report.errors.append(('duplicate', "Duplicate end points at indices {}.".format(report.duplicateEndPoints.tolist())))
+
+    # Use the same triangulation the blender would use if one isn't given
+    if simplices is None:
+        try:
+            simplices = spatial.Delaunay(startPoints).simplices
+        except Exception as e:
+            report.errors.append(('triangulation', "Delaunay triangulation failed: {}".format(str(e).splitlines()[0] if str(e) else type(e).__name__)))
+            return report
+
+    report.simplices = simplices
+
+    # Edge vectors of every triangle at alpha 0 (start) and alpha 1 (end)
+    start = startPoints[simplices]
+    end = endPoints[simplices]
+    a = start[:, 1] - start[:, 0]
+    c = start[:, 2] - start[:, 0]
+    b = end[:, 1] - end[:, 0]
+    d = end[:, 2] - end[:, 0]
+
+    # Twice the signed area along the morph is the quadratic
+    # A0 * (1 - alpha)^2 + M * alpha * (1 - alpha) + A1 * alpha^2
+    startArea = _Cross(a, c)
+    endArea = _Cross(b, d)
+    mixedArea = _Cross(a, d) + _Cross(b, c)
+
+    degenerate = (np.abs(startArea) <= tolerance) | (np.abs(endArea) <= tolerance)
+
+    # Minimum is at either end or at the vertex of the parabola if it falls inside [0, 1]
+    quadratic = startArea - mixedArea + endArea
+    linear = mixedArea - 2 * startArea
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vertex = np.where(quadratic != 0, -linear / (2 * quadratic), 0.0)
+    vertex = np.clip(vertex, 0.0, 1.0)
+
+    candidates = np.stack([np.zeros_like(vertex), vertex, np.ones_like(vertex)], axis=1)
+    areas = startArea[:, None] + linear[:, None] * candidates + quadratic[:, None] * candidates ** 2
+
+    # Orientation relative to the start triangle -- anything at or below zero has folded over
+    oriented = np.sign(startArea)[:, None] * areas
+    lowest = np.argmin(oriented, axis=1)
+    folded = ~degenerate & (oriented[np.arange(len(lowest)), lowest] <= tolerance)
+
+    report.degenerateTriangles = np.flatnonzero(degenerate)
+    report.foldedTriangles = np.flatnonzero(folded)
+    report.foldAlphas = _FirstRoot(startArea[folded], linear[folded], quadratic[folded], candidates[folded, lowest[folded]])
+
+    if report.degenerateTriangles.size:
+        report.errors.append(('degenerate', "{} zero area triangles: {}.".format(report.degenerateTriangles.size, report.degenerateTriangles.tolist())))
+    # Folded frames still render, so callers can choose to only warn about them
+    if report.foldedTriangles.size:
+        (report.warnings if allowFolds else report.errors).append(('folded', "{} triangles flip orientation during the morph: {}.".format(report.foldedTriangles.size, report.foldedTriangles.tolist())))
+
+    return report
+
+def _FirstRoot(constant, linear, quadratic, fallback):
+
+    # Smallest alpha in (0, 1] where the signed area constant + linear * alpha + quadratic * alpha^2 reaches zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        root = np.sqrt(np.maximum(linear ** 2 - 4 * quadratic * constant, 0.0))
+        roots = np.stack([np.where(quadratic != 0, (-linear - root) / (2 * quadratic), -constant / linear),
+                          np.where(quadratic != 0, (-linear + root) / (2 * quadratic), np.inf)], axis=1)
+
+    roots = np.where((roots > 0.0) & (roots <= 1.0), roots, np.inf).min(axis=1)
+
+    # Start degenerate triangles fold straight away -- tangent folds within tolerance keep the lowest point
+    roots = np.where(constant == 0, 0.0, roots)
+    return np.where(np.isfinite(roots), roots, fallback)
+
+def _Cross(u, v):
+
+    # Z component of the cross product for stacks of 2D vectors
+    return u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+
+def _DuplicateIndices(points):
+
+    _, inverse, counts = np.unique(points, axis=0, return_inverse=True, return_counts=True)
+    return np.flatnonzero(counts[inverse.ravel()] > 1)
+
+
+
 class Blender():
 
-    def __init__(self, startImage, startPoints, endImage, endPoints):
+    def __init__(self, startImage, startPoints, endImage, endPoints, backend = None, triangles = None):
 
         if type(startImage) is not np.ndarray or type(startPoints) is not np.ndarray or type(endImage) is not np.ndarray or type(endPoints) is not np.ndarray:
             raise TypeError("Inputs must be numpy arrays.")
@@ -119,44 +514,61 @@ class Blender():
         self.endImage = endImage
         self.endPoints = endPoints
 
-        # These triangles should be the same for all three images (source 1, 2 and target)
-        self.triangles = Delaunay(self.startPoints)
+        # These triangles should be the same for all three images (source 1, 2 and target) -- reuse a prepared triangulation if given
+        self.triangles = triangles if triangles is not None else spatial.Delaunay(self.startPoints)
 
-    def getBlendedImage(self, alpha):
+        # Backend name, instance, 'auto' for the closest match to the reference or 'fastest' to benchmark every backend for this size
+        self.backend = GetWarpBackend(backend, self.startImage.shape, len(self.triangles.simplices))
 
-        # Easy way to get target points with correspondences
-        targetPoints = (1 - alpha) * self.startPoints + alpha * self.endPoints
+        # Pre-filtered mip levels of each source image -- built on demand for reduced output sizes
+        self.startLevels = [self.startImage]
+        self.endLevels = [self.endImage]
 
-        # Generate blank images -- intermediates and blended
-        targetStart = np.array(Image.new('L', (self.startImage.shape[1], self.startImage.shape[0]), 0), np.uint8)
-        targetEnd = np.array(Image.new('L', (self.endImage.shape[1], self.endImage.shape[0]), 0), np.uint8)
+    def validate(self, tolerance = 1e-6, allowFolds = False):
 
-        # Go through all the triangles and create the two intermediate images
-        for tri in self.triangles.simplices:
+        # Check the correspondences against the triangulation used for blending
+        return ValidateCorrespondences(self.startPoints, self.endPoints, self.triangles.simplices, tolerance, allowFolds)
 
-            # Find actual points in source and target
-            currentStartPoints = np.array([[self.startPoints[tri[0], 0], self.startPoints[tri[0], 1]],
-                                           [self.startPoints[tri[1], 0], self.startPoints[tri[1], 1]],
-                                           [self.startPoints[tri[2], 0], self.startPoints[tri[2], 1]]], np.float64)
+    def getBlendedImage(self, alpha, outputSize = None, scale = None):
 
-            currentEndPoints = np.array([[self.endPoints[tri[0], 0], self.endPoints[tri[0], 1]],
-                                         [self.endPoints[tri[1], 0], self.endPoints[tri[1], 1]],
-                                         [self.endPoints[tri[2], 0], self.endPoints[tri[2], 1]]], np.float64)
+        # Output size as (width, height) -- defaults to the full size of the start image
+        size = self._OutputSize(outputSize, scale)
 
-            # Vertices of triangles in target image
-            currentTargetPoints = np.array([[targetPoints[tri[0], 0], targetPoints[tri[0], 1]],
-                                            [targetPoints[tri[1], 0], targetPoints[tri[1], 1]],
-                                            [targetPoints[tri[2], 0], targetPoints[tri[2], 1]]], np.float64)
+        # Easy way to get target points with correspondences -- then moved into output pixels
+        targetPoints = (1 - alpha) * self.startPoints + alpha * self.endPoints
+        targetPoints = _ScalePoints(targetPoints, self.startImage, size)
 
-            # Create affine instances
-            Affine(currentStartPoints, currentTargetPoints).transform(self.startImage, targetStart)
-            Affine(currentEndPoints, currentTargetPoints).transform(self.endImage, targetEnd)
+        # Sample from the smallest pre-filtered level that still covers the output
+        startImage = _MipLevel(self.startLevels, size)
+        endImage = _MipLevel(self.endLevels, size)
+        startPoints = _ScalePoints(self.startPoints, self.startImage, (startImage.shape[1], startImage.shape[0]))
+        endPoints = _ScalePoints(self.endPoints, self.endImage, (endImage.shape[1], endImage.shape[0]))
+
+        # Generate blank images -- intermediates and blended
+        targetStart = np.zeros((size[1], size[0]) + self.startImage.shape[2:], np.uint8)
+        targetEnd = np.zeros((size[1], size[0]) + self.endImage.shape[2:], np.uint8)
+
+        # Warp all the triangles to create the two intermediate images
+        self.backend.warp(startImage, startPoints, targetPoints, self.triangles.simplices, targetStart)
+        self.backend.warp(endImage, endPoints, targetPoints, self.triangles.simplices, targetEnd)
 
         # Perform the blend between the intermediate images -- uses alpha equation
 
         return ((1 - alpha) * targetStart + alpha * targetEnd).astype(dtype='uint8')
 
-    def generateMorphVideo(self, targetFolderPath, sequenceLength, includeReversed = True):
+    def getFrame(self, alpha, outputSize = None, scale = None):
+
+        size = self._OutputSize(outputSize, scale)
+
+        # The ends of a sequence are the source images themselves
+        if alpha <= 0.0:
+            return _ResizeImage(_MipLevel(self.startLevels, size), size)
+        elif alpha >= 1.0:
+            return _ResizeImage(_MipLevel(self.endLevels, size), size)
+
+        return self.getBlendedImage(alpha, size)
+
+    def generateMorphVideo(self, targetFolderPath, sequenceLength, includeReversed = True, fps = 5, codec = None, bitrate = None, container = 'mp4', segments = 1, sampling = 'uniform', easing = 'linear', threshold = 2.0, outputSize = None, scale = None):
 
         # Create the folder if it doesn't exist
         if not os.path.exists(targetFolderPath):
@@ -169,35 +581,29 @@ class Blender():
         imageList = []
         fileList = []
 
-        # Save starting image
-        self._SaveImage(self.startImage, targetFolderPath + '/' + self._FrameName(1))
-        imageList.append(self.startImage)
-        fileList.append(targetFolderPath + '/' + self._FrameName(1))
-
-        # Generate in between images -- sequenceLength - 2 images -- make sure total number of images equals sequenceLength
-
-        # Increment amount
-        increment = float(1.0 / ((sequenceLength - 2) + 1))
-        alpha = 0.0
-        for i in range(sequenceLength - 2):
-            # Get alpha value, save image, and append to the file list
-            alpha += increment
-            #print(alpha)
-            image = self.getBlendedImage(alpha)
+        # Every slot sits on a uniform timeline -- adaptive sampling only renders some of them
+        alphas, rendered = self._SamplingPlan(sequenceLength, sampling, easing, threshold)
+        renderedImages = dict((i, self.getFrame(alphas[i], outputSize, scale)) for i in rendered)
+
+        for i in range(len(alphas)):
+            # Slots that were not rendered cross-fade between the nearest rendered frames
+            image = renderedImages.get(i)
+            if image is None:
+                before = max(j for j in rendered if j < i)
+                after = min(j for j in rendered if j > i)
+                weight = float(i - before) / (after - before)
+                image = np.round((1 - weight) * renderedImages[before] + weight * renderedImages[after]).astype(np.uint8)
+
             self._SaveImage(image, targetFolderPath + '/' + self._FrameName(i + 1))
 
             # Append to lists
             imageList.append(image)
             fileList.append(targetFolderPath + '/' + self._FrameName(i + 1))
 
-        self._SaveImage(self.endImage, targetFolderPath + '/' + self._FrameName(sequenceLength))
-        imageList.append(self.endImage)
-        fileList.append(targetFolderPath + '/' + self._FrameName(sequenceLength))
-
         # Create the reverse set of images -- keep increasing numbering
         if includeReversed:
             # Write out the image files starting at the end of the imageList
-            seqNum = sequenceLength + 1
+            seqNum = len(imageList) + 1
             # Traverse the images starting at the end
             for image in reversed(imageList):
                 # Save the image, apend to the fileList, and increase the sequence number
@@ -205,15 +611,92 @@ class Blender():
                 fileList.append(targetFolderPath + '/' + self._FrameName(seqNum))
                 seqNum += 1
 
-        # Now create the mp4 video
-        writer = io.get_writer(targetFolderPath + '/' + 'morph.mp4', fps=5)
+        # Now create the video -- segments are encoded in parallel when more than one is requested
+        encoder = VideoEncoder(fps=fps, codec=codec, bitrate=bitrate, container=container)
+        encoder.encode(fileList, targetFolderPath + '/' + 'morph' + encoder.extension, segments=segments)
+
+    def getAlphaSequence(self, sequenceLength, sampling = 'uniform', easing = 'linear', threshold = 2.0, coarseLength = 5, proxySize = 128):
+
+        # Alphas of the frames that are actually rendered
+        alphas, rendered = self._SamplingPlan(sequenceLength, sampling, easing, threshold, coarseLength, proxySize)
+        return [alphas[i] for i in rendered]
+
+    def _SamplingPlan(self, sequenceLength, sampling = 'uniform', easing = 'linear', threshold = 2.0, coarseLength = 5, proxySize = 128):
+
+        if sequenceLength < 2:
+            raise ValueError("Sequences need at least 2 frames.")
+        elif sampling not in ('uniform', 'adaptive'):
+            raise ValueError("Sampling must be 'uniform' or 'adaptive'.")
 
-        # Write out to the mp4 video
-        for im in fileList:
-            writer.append_data(io.imread(im))
+        curve = easing if callable(easing) else easingCurves.get(easing)
+        if curve is None:
+            raise ValueError("Easing must be a callable or one of: {}.".format(', '.join(easingCurves)))
 
-        # Close the image writer
-        writer.close()
+        # One alpha per slot of the uniform timeline
+        alphas = [float(np.clip(curve(t), 0.0, 1.0)) for t in np.linspace(0.0, 1.0, sequenceLength)]
+
+        # Uniform renders every slot -- adaptive picks the slots worth rendering
+        if sampling == 'uniform' or sequenceLength <= coarseLength:
+            rendered = list(range(sequenceLength))
+        else:
+            rendered = self._AdaptiveSlots(alphas, threshold, coarseLength, proxySize)
+
+        return alphas, rendered
+
+    def _AdaptiveSlots(self, alphas, threshold, coarseLength, proxySize):
+
+        # Render a small proxy of the morph to measure how much neighbouring frames change
+        proxyScale = min(1.0, float(proxySize) / max(self.startImage.shape[0], self.startImage.shape[1]))
+
+        def ProxyFrame(slot):
+            # Endpoints go through the same warp as every other sample so differences shrink as intervals do
+            return self.getBlendedImage(alphas[slot], scale=proxyScale).astype(np.float64)
+
+        def Difference(first, second):
+            # Mean absolute difference in intensity levels
+            return np.mean(np.abs(first - second))
+
+        slots = sorted(set(int(slot) for slot in np.round(np.linspace(0, len(alphas) - 1, coarseLength))))
+        frames = dict((slot, ProxyFrame(slot)) for slot in slots)
+
+        # Intervals ordered by the largest change first
+        intervals = [(-Difference(frames[first], frames[second]), first, second) for first, second in zip(slots[:-1], slots[1:])]
+        heapq.heapify(intervals)
+
+        # Split the worst interval until all are under the threshold -- intervals are never narrower than one slot
+        while intervals:
+            difference, first, second = heapq.heappop(intervals)
+            if -difference <= threshold:
+                break
+            elif second - first < 2:
+                continue
+
+            middle = (first + second) // 2
+            frames[middle] = ProxyFrame(middle)
+
+            heapq.heappush(intervals, (-Difference(frames[first], frames[middle]), first, middle))
+            heapq.heappush(intervals, (-Difference(frames[middle], frames[second]), middle, second))
+
+        return sorted(frames)
+
+    def _OutputSize(self, outputSize, scale):
+
+        height, width = self.startImage.shape[0], self.startImage.shape[1]
+
+        if outputSize is not None:
+            size = (int(outputSize[0]), int(outputSize[1]))
+        elif scale is not None:
+            # Checked before clamping -- otherwise a zero or negative scale would quietly give a 1x1 frame
+            if not scale > 0:
+                raise ValueError("Scale must be positive.")
+            size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+        else:
+            size = (width, height)
+
+        if size[0] <= 0 or size[1] <= 0:
+            raise ValueError("Output size must be positive.")
+
+        return size
 
     def _FrameName(self, number):
 
@@ -241,43 +724,239 @@ class ColorAffine(Affine):
 
 class ColorBlender(Blender):
 
-    def __init__(self, startImage, startPoints, endImage, endPoints):
-        # Call the base constructor
-        super().__init__(startImage, startPoints, endImage, endPoints)
+    def __init__(self, startImage, startPoints, endImage, endPoints, backend = None, triangles = None):
+        # Call the base constructor -- warp backends handle both gray and color images
+        super().__init__(startImage, startPoints, endImage, endPoints, backend, triangles)
 
-    def getBlendedImage(self, alpha):
 
-        # Easy way to get target points with correspondences
-        targetPoints = (1 - alpha) * self.startPoints + alpha * self.endPoints
 
-        # Generate blank images -- intermediates and blended
-        targetStart = np.array(Image.new('RGB', (self.startImage.shape[1], self.startImage.shape[0]), (0, 0, 0)), np.uint8)
-        targetEnd = np.array(Image.new('RGB', (self.endImage.shape[1], self.endImage.shape[0]), (0, 0, 0)), np.uint8)
+class MorphChain():
 
-        # Go through all the triangles and create the two intermediate images
-        for tri in self.triangles.simplices:
+    def __init__(self, keyframes, backend = None):
 
-            # Find actual points in source and target
-            currentStartPoints = np.array([[self.startPoints[tri[0], 0], self.startPoints[tri[0], 1]],
-                                           [self.startPoints[tri[1], 0], self.startPoints[tri[1], 1]],
-                                           [self.startPoints[tri[2], 0], self.startPoints[tri[2], 1]]], np.float64)
+        # Keyframes are an ordered list of (image, points) pairs
+        if len(keyframes) < 2:
+            raise ValueError("A morph chain needs at least 2 keyframes.")
 
-            currentEndPoints = np.array([[self.endPoints[tri[0], 0], self.endPoints[tri[0], 1]],
-                                         [self.endPoints[tri[1], 0], self.endPoints[tri[1], 1]],
-                                         [self.endPoints[tri[2], 0], self.endPoints[tri[2], 1]]], np.float64)
+        for image, points in keyframes:
+            if type(image) is not np.ndarray or type(points) is not np.ndarray:
+                raise TypeError("Keyframe images and points must be numpy arrays.")
+            elif len(image.shape) != len(keyframes[0][0].shape):
+                raise ValueError("Keyframes must all be gray scale or all be color.")
+            elif image.shape != keyframes[0][0].shape:
+                raise ValueError("Keyframes must all be the same size.")
 
-            # Vertices of triangles in target image
-            currentTargetPoints = np.array([[targetPoints[tri[0], 0], targetPoints[tri[0], 1]],
-                                            [targetPoints[tri[1], 0], targetPoints[tri[1], 1]],
-                                            [targetPoints[tri[2], 0], targetPoints[tri[2], 1]]], np.float64)
+        self.images = [image for image, _ in keyframes]
+        self.points = [points for _, points in keyframes]
 
-            # Create affine instances
-            ColorAffine(currentStartPoints, currentTargetPoints).transform(self.startImage, targetStart)
-            ColorAffine(currentEndPoints, currentTargetPoints).transform(self.endImage, targetEnd)
+        # Each keyframe is decoded and triangulated once -- the triangulation is used for the transition it starts
+        triangulations = [spatial.Delaunay(points) for points in self.points[:-1]]
 
-        # Perform the blend between the intermediate images -- uses alpha equation
+        # Bad correspondences fail here rather than partway through a video
+        for i, triangulation in enumerate(triangulations):
+            report = ValidateCorrespondences(self.points[i], self.points[i + 1], triangulation.simplices, allowFolds=True)
+            if not report.isValid:
+                raise ValueError("Keyframes {} and {} have invalid correspondences: {}".format(i, i + 1, report))
 
-        return ((1 - alpha) * targetStart + alpha * targetEnd).astype(dtype='uint8')
+        # Mip levels are shared too so each keyframe is only filtered once
+        levels = [[image] for image in self.images]
+
+        blenderType = ColorBlender if len(self.images[0].shape) == 3 else Blender
+        self.blenders = []
+        for i in range(len(self.images) - 1):
+            blender = blenderType(self.images[i], self.points[i], self.images[i + 1], self.points[i + 1], backend, triangulations[i])
+            blender.startLevels = levels[i]
+            blender.endLevels = levels[i + 1]
+            self.blenders.append(blender)
+
+            # Later transitions reuse the backend picked for the first one
+            backend = blender.backend
+
+    def getBlendedImage(self, position, outputSize = None, scale = None):
+
+        # Position runs from 0 to the number of transitions -- the integer part picks the transition
+        transition = min(int(position), len(self.blenders) - 1)
+        return self.blenders[transition].getBlendedImage(position - transition, outputSize, scale)
+
+    def getFrameSequence(self, framesPerTransition, easing = 'linear'):
+
+        # (transition, alpha) for every frame -- shared keyframes only appear once
+        frames = []
+        for i, blender in enumerate(self.blenders):
+            alphas = blender.getAlphaSequence(framesPerTransition, easing=easing)
+            if i < len(self.blenders) - 1:
+                alphas = alphas[:-1]
+
+            frames.extend((i, alpha) for alpha in alphas)
+
+        return frames
+
+    def generateMorphVideo(self, outputPath, framesPerTransition, easing = 'linear', fps = 5, codec = None, bitrate = None, container = 'mp4', workers = None, outputSize = None, scale = None):
+
+        # Create the folder if it doesn't exist
+        folder = os.path.dirname(outputPath)
+        if folder and not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError as e:
+                pass
+
+        frames = self.getFrameSequence(framesPerTransition, easing)
+        encoder = VideoEncoder(fps=fps, codec=codec, bitrate=bitrate, container=container)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        # The video is written next to the output and only renamed once it is complete
+        base, extension = os.path.splitext(outputPath)
+        partialPath = base + '.partial' + extension
+
+        try:
+            if workers <= 1:
+                encoder.stream((self._RenderFrame(frame, outputSize, scale) for frame in frames), partialPath)
+            else:
+                # Frames from every transition are rendered across the pool and streamed to one writer in order
+                with futures.ProcessPoolExecutor(max_workers=workers, initializer=_InitChainWorker, initargs=(self,)) as executor:
+                    encoder.stream(_RenderChainFrames(executor, frames, outputSize, scale, 2 * workers), partialPath)
+        except BaseException:
+            if os.path.exists(partialPath):
+                os.remove(partialPath)
+            raise
+
+        os.replace(partialPath, outputPath)
+
+    def _RenderFrame(self, frame, outputSize = None, scale = None):
+
+        transition, alpha = frame
+        return self.blenders[transition].getFrame(alpha, outputSize, scale)
+
+
+
+# Chain shared with every frame rendered in a worker process
+_workerChain = None
+
+def _InitChainWorker(chain):
+
+    global _workerChain
+    _workerChain = chain
+
+def _RenderChainFrame(frame, outputSize, scale):
+
+    return _workerChain._RenderFrame(frame, outputSize, scale)
+
+def _RenderChainFrames(executor, frames, outputSize, scale, window):
+
+    # Only a window of frames is in flight -- finished frames never pile up ahead of a slower writer
+    frames = iter(frames)
+    pending = deque(executor.submit(_RenderChainFrame, frame, outputSize, scale) for frame in islice(frames, window))
+
+    while pending:
+        image = pending.popleft().result()
+
+        # Top the window up before handing the frame over so the workers stay busy while it is written
+        for frame in islice(frames, 1):
+            pending.append(executor.submit(_RenderChainFrame, frame, outputSize, scale))
+
+        yield image
+
+
+
+class VideoEncoder():
+
+    # Default codec and file extension for each supported container
+    containers = {'mp4': ('libx264', '.mp4'),
+                  'webm': ('libvpx-vp9', '.webm'),
+                  'gif': (None, '.gif')}
+
+    def __init__(self, fps = 5, codec = None, bitrate = None, container = 'mp4'):
+
+        if container not in self.containers:
+            raise ValueError("Container must be one of: {}.".format(', '.join(sorted(self.containers))))
+        elif fps <= 0:
+            raise ValueError("Frames per second must be positive.")
+
+        self.fps = fps
+        self.bitrate = bitrate
+        self.container = container
+        self.codec = codec if codec is not None else self.containers[container][0]
+        self.extension = self.containers[container][1]
+
+    def encode(self, fileList, outputPath, segments = 1):
+
+        # Gif frames can't be stream copied -- always write them in a single pass
+        if self.container == 'gif':
+            self._WriteGif(fileList, outputPath)
+            return
+
+        # One segment per core if not specified -- never more segments than frames
+        if segments is None:
+            segments = os.cpu_count() or 1
+        segments = max(1, min(segments, len(fileList)))
+
+        if segments == 1:
+            self._WriteSegment(fileList, outputPath)
+            return
+
+        # Split into contiguous segments and encode each one on its own writer
+        bounds = np.linspace(0, len(fileList), segments + 1).astype(int)
+        segmentFiles = [fileList[bounds[i]:bounds[i + 1]] for i in range(segments)]
+        segmentPaths = ['{}.part{:03d}{}'.format(outputPath, i, self.extension) for i in range(segments)]
+
+        try:
+            with futures.ThreadPoolExecutor(max_workers=segments) as executor:
+                list(executor.map(self._WriteSegment, segmentFiles, segmentPaths))
+
+            # Join the segments back together without re-encoding
+            self._Concatenate(segmentPaths, outputPath)
+        finally:
+            for path in segmentPaths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def stream(self, frames, outputPath):
+
+        # Gif frames have to be collected before they can be saved
+        if self.container == 'gif':
+            frames = [Image.fromarray(frame) for frame in frames]
+
+            # Gif durations are in milliseconds per frame
+            frames[0].save(outputPath, save_all=True, append_images=frames[1:], duration=int(round(1000.0 / self.fps)), loop=0)
+            return
+
+        writer = io.get_writer(outputPath, fps=self.fps, codec=self.codec, bitrate=self.bitrate)
+
+        # Write out each frame as it arrives
+        try:
+            for frame in frames:
+                writer.append_data(frame)
+        finally:
+            # Close the image writer
+            writer.close()
+
+    def _WriteSegment(self, fileList, outputPath):
+
+        self.stream((io.imread(im) for im in fileList), outputPath)
+
+    def _WriteGif(self, fileList, outputPath):
+
+        self.stream((np.array(Image.open(im)) for im in fileList), outputPath)
+
+    def _Concatenate(self, segmentPaths, outputPath):
+
+        import imageio_ffmpeg
+
+        # The concat demuxer reads the segments from a list file
+        listPath = outputPath + '.segments.txt'
+        with open(listPath, 'w') as listFile:
+            for path in segmentPaths:
+                listFile.write("file '{}'\n".format(os.path.abspath(path).replace("'", "'\\''")))
+
+        try:
+            subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+                            '-f', 'concat', '-safe', '0', '-i', listPath,
+                            '-c', 'copy', outputPath], check=True)
+        finally:
+            os.remove(listPath)
 
 
 
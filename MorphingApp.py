@@ -1,5 +1,7 @@
 import sys
-from Morphing import *
+import numpy as np
+from PIL import Image
+from Morphing import Blender, ColorBlender, ValidateCorrespondences
 from PySide.QtGui import *
 from PySide.QtCore import *
 from MorphingGUI import *
@@ -57,7 +59,13 @@ class MorphingConsumer(QMainWindow, Ui_MainWindow):
     def BlendImages(self):
         # Blend the two images together
 
-        blendedImage = self.blender.getBlendedImage(self.alpha)
+        # Only render as many pixels as the view can show -- full resolution while the view has no size yet
+        viewport = self.blendImage.viewport()
+        if viewport.width() > 0 and viewport.height() > 0:
+            scale = min(1.0, viewport.width() / float(self.startImageArray.shape[1]), viewport.height() / float(self.startImageArray.shape[0]))
+        else:
+            scale = None
+        blendedImage = self.blender.getBlendedImage(self.alpha, scale=scale)
 
         # Display the image
         scene = QGraphicsScene(self)
@@ -131,19 +139,10 @@ class MorphingConsumer(QMainWindow, Ui_MainWindow):
         self.currentStartEllipse.setBrush(QColor(Qt.blue))
         self.currentEndEllipse.setBrush(QColor(Qt.blue))
 
-        # Try to create the blender -- If you can't then keep the blend button and triangle checkbox disabled because there aren't enough poins
-        try:
-            # Always make the blender based on if its color or gray scale
-            if len(self.startImageArray.shape) == 3:
-                self.blender = ColorBlender(startImage=self.startImageArray, startPoints=self.startPoints, endImage=self.endImageArray, endPoints=self.endPoints)
-            else:
-                self.blender = Blender(startImage=self.startImageArray, startPoints=self.startPoints, endImage=self.endImageArray, endPoints=self.endPoints)
-
-            self.trianglesCheckBox.setEnabled(True)
-            self.blendButton.setEnabled(True)
-        except:
-            self.trianglesCheckBox.setEnabled(False)
-            self.blendButton.setEnabled(False)
+        # Create the blender -- If the points can't be blended then keep the blend button and triangle checkbox disabled
+        canBlend = self.CreateBlender()
+        self.trianglesCheckBox.setEnabled(canBlend)
+        self.blendButton.setEnabled(canBlend)
 
         # Check if triangles should be reevaluated -- do so if necessary
         if self.trianglesCheckBox.isChecked():
@@ -333,18 +332,28 @@ class MorphingConsumer(QMainWindow, Ui_MainWindow):
             # Enable widgets
             self.alphaSlider.setEnabled(True)
 
-            # Try to create the blender -- if you can't then disable the appropriate buttons
-            try:
-                # Check if grayscale or color first
-                if len(self.startImageArray.shape) == 3:
-                    self.blender = ColorBlender(startImage=self.startImageArray, startPoints=self.startPoints, endImage=self.endImageArray, endPoints=self.endPoints)
-                else:
-                    self.blender = Blender(startImage=self.startImageArray, startPoints=self.startPoints, endImage=self.endImageArray, endPoints=self.endPoints)
-
+            # Create the blender -- if you can't then leave the appropriate buttons disabled
+            if self.CreateBlender():
                 self.trianglesCheckBox.setEnabled(True)
                 self.blendButton.setEnabled(True)
-            except:
-                pass
+
+
+    def CreateBlender(self):
+
+        # Check the correspondences up front -- folded triangles still render so only warn about them
+        report = ValidateCorrespondences(self.startPoints, self.endPoints, allowFolds=True)
+        self.statusbar.showMessage(str(report).replace('\n', ' '))
+
+        if not report.isValid:
+            return False
+
+        # Check if grayscale or color first
+        if len(self.startImageArray.shape) == 3:
+            self.blender = ColorBlender(startImage=self.startImageArray, startPoints=self.startPoints, endImage=self.endImageArray, endPoints=self.endPoints)
+        else:
+            self.blender = Blender(startImage=self.startImageArray, startPoints=self.startPoints, endImage=self.endImageArray, endPoints=self.endPoints)
+
+        return True
 
 
     def GetFilePath(self):
@@ -0,0 +1,192 @@
+import numpy as np
+from Morphing import Blender, ColorBlender, OpenCVBackend, Image, ndimage
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+
+# Modules that must not be loaded just by importing Morphing
+heavyModules = ('scipy', 'imageio', 'PIL', 'cv2', 'multiprocessing')
+
+def MeasureImportTime(moduleName = 'Morphing', repeats = 5):
+
+    # Every sample runs in a fresh interpreter so nothing is already cached in sys.modules
+    script = ("import sys, time\n"
+              "start = time.perf_counter()\n"
+              "import {}\n"
+              "print(time.perf_counter() - start)\n"
+              "print(','.join(name for name in {!r} if name in sys.modules))\n").format(moduleName, heavyModules)
+
+    timings = []
+    loaded = set()
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.splitlines()
+        timings.append(float(output[0]))
+        loaded.update(name for name in output[1].split(',') if name)
+
+    # Fastest sample is the least disturbed by the rest of the machine
+    return min(timings), sorted(loaded)
+
+def CheckImportBudget(budget = 0.3, moduleName = 'Morphing', repeats = 5):
+
+    seconds, loaded = MeasureImportTime(moduleName, repeats)
+    print("import {}: {:.3f} s (budget {:.3f} s)".format(moduleName, seconds, budget))
+
+    if loaded:
+        print("Heavy modules loaded at import: {}".format(', '.join(loaded)))
+
+    return seconds <= budget and not loaded
+
+
+
+# Fast paths checked against the reference Affine.transform + interpn output -- aggressive
+# options get looser thresholds since downscaled renders are compared to a downscaled reference
+engineOptions = [{'name': 'map_coordinates', 'backend': 'map_coordinates', 'scale': None, 'psnr': 45.0, 'ssim': 0.995},
+                 {'name': 'opencv', 'backend': 'opencv', 'scale': None, 'psnr': 32.0, 'ssim': 0.98},
+                 {'name': 'map_coordinates@0.5', 'backend': 'map_coordinates', 'scale': 0.5, 'psnr': 30.0, 'ssim': 0.95},
+                 {'name': 'opencv@0.5', 'backend': 'opencv', 'scale': 0.5, 'psnr': 30.0, 'ssim': 0.95},
+                 {'name': 'map_coordinates@0.25', 'backend': 'map_coordinates', 'scale': 0.25, 'psnr': 27.0, 'ssim': 0.93}]
+
+def PSNR(first, second):
+
+    error = np.mean((first.astype(np.float64) - second.astype(np.float64)) ** 2)
+    if error == 0:
+        return float('inf')
+
+    return 10 * np.log10(255.0 ** 2 / error)
+
+def SSIM(first, second):
+
+    # Gaussian window SSIM averaged over the channels
+    first = first.astype(np.float64).reshape(first.shape[:2] + (-1,))
+    second = second.astype(np.float64).reshape(second.shape[:2] + (-1,))
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    scores = []
+    for channel in range(first.shape[2]):
+        x, y = first[:, :, channel], second[:, :, channel]
+        muX, muY = ndimage.gaussian_filter(x, 1.5), ndimage.gaussian_filter(y, 1.5)
+        varX = ndimage.gaussian_filter(x * x, 1.5) - muX ** 2
+        varY = ndimage.gaussian_filter(y * y, 1.5) - muY ** 2
+        covariance = ndimage.gaussian_filter(x * y, 1.5) - muX * muY
+        scores.append(np.mean(((2 * muX * muY + c1) * (2 * covariance + c2)) / ((muX ** 2 + muY ** 2 + c1) * (varX + varY + c2))))
+
+    return float(np.mean(scores))
+
+def BundledCase(mode):
+
+    # The Tiger/Wolf pair shipped with the repository
+    folder = os.path.dirname(os.path.abspath(__file__))
+    startImage = np.array(Image.open(os.path.join(folder, 'Tiger2Color.jpg')).convert(mode))
+    endImage = np.array(Image.open(os.path.join(folder, 'WolfColor.jpg')).convert(mode))
+    startPoints = np.loadtxt(os.path.join(folder, 'Tiger2Color.jpg.txt'))
+    endPoints = np.loadtxt(os.path.join(folder, 'WolfColor.jpg.txt'))
+
+    return startImage, startPoints, endImage, endPoints
+
+def SyntheticCase(mode, width = 320, height = 240, cells = 6, seed = 0):
+
+    random = np.random.RandomState(seed)
+    x, y = np.meshgrid(np.arange(width), np.arange(height))
+
+    # Smooth gradients plus hard checker edges and rings to expose sampling errors
+    def Pattern(phase):
+        checker = ((x // 16 + y // 16 + phase) % 2) * 80.0
+        rings = 60.0 * (np.sin(np.hypot(x - width / 2.0, y - height / 2.0) / (4.0 + phase)) > 0)
+        channels = [(x * 255.0 / width + checker + rings) % 256, (y * 255.0 / height + rings) % 256, (checker + 255.0 * x * y / (width * height)) % 256]
+        return np.stack(channels, axis=2).astype(np.uint8)
+
+    startImage = np.array(Image.fromarray(Pattern(0)).convert(mode))
+    endImage = np.array(Image.fromarray(Pattern(1)).convert(mode))
+
+    # Jittered grid correspondences that keep the border fixed
+    gridX, gridY = np.meshgrid(np.linspace(0, width - 1, cells + 1), np.linspace(0, height - 1, cells + 1))
+    startPoints = np.stack([gridX.ravel(), gridY.ravel()], axis=1)
+    endPoints = startPoints.copy()
+    inner = (startPoints[:, 0] > 0) & (startPoints[:, 0] < width - 1) & (startPoints[:, 1] > 0) & (startPoints[:, 1] < height - 1)
+    endPoints[inner] += random.uniform(-0.3, 0.3, (inner.sum(), 2)) * [(width - 1) / cells, (height - 1) / cells]
+
+    return startImage, startPoints, endImage, endPoints
+
+regressionCases = [('tiger-wolf-color', lambda: BundledCase('RGB')),
+                   ('tiger-wolf-gray', lambda: BundledCase('L')),
+                   ('synthetic-color', lambda: SyntheticCase('RGB')),
+                   ('synthetic-gray', lambda: SyntheticCase('L'))]
+
+def RunRegression(alphas = (0.25, 0.5, 0.75), cases = None, engines = None):
+
+    results = []
+
+    for caseName, loadCase in regressionCases:
+        if cases is not None and caseName not in cases:
+            continue
+
+        startImage, startPoints, endImage, endPoints = loadCase()
+        blenderType = ColorBlender if len(startImage.shape) == 3 else Blender
+
+        # Reference frames and timing from the original path
+        reference = blenderType(startImage, startPoints, endImage, endPoints, backend='reference')
+        start = time.perf_counter()
+        referenceFrames = [reference.getBlendedImage(alpha) for alpha in alphas]
+        referenceSeconds = time.perf_counter() - start
+
+        for option in engineOptions:
+            if engines is not None and option['name'] not in engines:
+                continue
+            elif option['backend'] == 'opencv' and not OpenCVBackend.isAvailable():
+                continue
+
+            blender = blenderType(startImage, startPoints, endImage, endPoints, backend=option['backend'])
+            start = time.perf_counter()
+            frames = [blender.getBlendedImage(alpha, scale=option['scale']) for alpha in alphas]
+            seconds = time.perf_counter() - start
+
+            # Downscaled renders are judged against the reference filtered down to the same size
+            psnr, ssim = [], []
+            for frame, referenceFrame in zip(frames, referenceFrames):
+                if frame.shape != referenceFrame.shape:
+                    referenceFrame = np.array(Image.fromarray(referenceFrame).resize((frame.shape[1], frame.shape[0]), Image.BOX))
+
+                # The outermost ring is left out -- interpn drops samples there on round-off alone
+                psnr.append(PSNR(frame[1:-1, 1:-1], referenceFrame[1:-1, 1:-1]))
+                ssim.append(SSIM(frame[1:-1, 1:-1], referenceFrame[1:-1, 1:-1]))
+
+            results.append({'case': caseName, 'engine': option['name'], 'seconds': seconds,
+                            'speedup': referenceSeconds / seconds, 'psnr': min(psnr), 'ssim': min(ssim),
+                            'passed': min(psnr) >= option['psnr'] and min(ssim) >= option['ssim']})
+
+    return results
+
+def PrintRegression(results):
+
+    print("{:<18} {:<22} {:>9} {:>9} {:>8} {:>7}  {}".format('case', 'engine', 'seconds', 'speedup', 'psnr', 'ssim', 'status'))
+    for result in results:
+        print("{case:<18} {engine:<22} {seconds:>9.3f} {speedup:>8.1f}x {psnr:>8.2f} {ssim:>7.4f}  ".format(**result) + ('ok' if result['passed'] else 'FAIL'))
+
+    return all(result['passed'] for result in results)
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Performance checks for the morphing module.")
+    parser.add_argument('--import-budget', type=float, default=0.3, help="Seconds allowed for a cold import of Morphing.")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--alphas', type=float, nargs='+', default=[0.25, 0.5, 0.75])
+    parser.add_argument('--cases', nargs='+', choices=[name for name, _ in regressionCases], default=None)
+    parser.add_argument('--engines', nargs='+', choices=[option['name'] for option in engineOptions], default=None)
+    parser.add_argument('--skip-imports', action='store_true', help="Skip the import-time budget check.")
+    parser.add_argument('--skip-regression', action='store_true', help="Skip the speed versus accuracy regression.")
+    args = parser.parse_args()
+
+    passed = True
+    if not args.skip_imports:
+        passed = CheckImportBudget(args.import_budget, repeats=args.repeats) and passed
+    if not args.skip_regression:
+        passed = PrintRegression(RunRegression(args.alphas, args.cases, args.engines)) and passed
+
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,525 @@
+import numpy as np
+from Morphing import Blender, ColorBlender, ValidateCorrespondences
+from PIL import Image
+
+import os
+import json
+import time
+import stat
+import socket
+import hashlib
+import argparse
+import threading
+import socketserver
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from http.client import HTTPConnection
+
+
+# Prepared blenders kept warm inside each worker process -- keyed by image and point hashes
+_preparedMorphs = OrderedDict()
+_preparedLimit = 8
+
+def _InitWorker(cacheSize):
+
+    global _preparedLimit
+    _preparedLimit = cacheSize
+
+def _PreparedMorph(job):
+
+    # Most recently used morphs live at the end of the cache
+    blender = _preparedMorphs.pop(job['key'], None)
+
+    if blender is None:
+        startImage = np.array(Image.open(job['startImage']))
+        endImage = np.array(Image.open(job['endImage']))
+        startPoints = np.loadtxt(job['startPoints'])
+        endPoints = np.loadtxt(job['endPoints'])
+
+        # Reject bad correspondences before paying for any rendering
+        report = ValidateCorrespondences(startPoints, endPoints, allowFolds=True)
+        if not report.isValid:
+            raise ValueError(str(report))
+
+        if len(startImage.shape) == 3:
+            blender = ColorBlender(startImage=startImage, startPoints=startPoints, endImage=endImage, endPoints=endPoints)
+        else:
+            blender = Blender(startImage=startImage, startPoints=startPoints, endImage=endImage, endPoints=endPoints)
+
+        while len(_preparedMorphs) >= _preparedLimit:
+            _preparedMorphs.popitem(last=False)
+
+    _preparedMorphs[job['key']] = blender
+    return blender
+
+def _RenderFrames(job, alphas):
+
+    blender = _PreparedMorph(job)
+
+    # Encode in the worker so the server threads only move bytes
+    frames = []
+    for alpha in alphas:
+        buffer = BytesIO()
+        Image.fromarray(blender.getFrame(alpha, job['outputSize'], job['scale'])).save(buffer, format='PNG')
+        frames.append(buffer.getvalue())
+
+    return frames
+
+def _RenderSequence(job, alphas, fileNames):
+
+    blender = _PreparedMorph(job)
+
+    for alpha, fileName in zip(alphas, fileNames):
+        blender._SaveImage(blender.getFrame(alpha, job['outputSize'], job['scale']), fileName)
+
+    return fileNames
+
+
+
+class FrameBatcher():
+
+    def __init__(self, workers, createWorker, window = 0.01, maxBatch = 16):
+
+        # Shared with the server -- broken workers are replaced in place
+        self.workers = workers
+        self.createWorker = createWorker
+        self.workerLock = threading.Lock()
+        self.window = window
+        self.maxBatch = maxBatch
+
+        # Frames each worker still has to render -- new batches go to the least loaded worker
+        self.load = {}
+
+        # Pending frames grouped by morph key -- flushed together after the batching window
+        self.pending = OrderedDict()
+        self.condition = threading.Condition()
+
+        self.thread = threading.Thread(target=self._Run, daemon=True)
+        self.thread.start()
+
+    def submit(self, job, alpha):
+
+        future = Future()
+
+        # Frames only batch together when they share the morph and the output size
+        with self.condition:
+            self.pending.setdefault((job['key'], job['outputSize'], job['scale']), (job, []))[1].append((alpha, future))
+            self.condition.notify()
+
+        return future
+
+    def _Run(self):
+
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+
+            # Give concurrent requests a chance to join this batch
+            time.sleep(self.window)
+
+            with self.condition:
+                pending = self.pending
+                self.pending = OrderedDict()
+
+            for job, requests in pending.values():
+                # Concurrent frames of one morph are spread over the workers so they render in parallel
+                home = int(job['key'][:8], 16)
+                chunks = max(min(len(self.workers), len(requests)), -(-len(requests) // self.maxBatch))
+                bounds = np.linspace(0, len(requests), chunks + 1).astype(int)
+
+                for i in range(chunks):
+                    batch = requests[bounds[i]:bounds[i + 1]]
+                    worker = self._Acquire(home, len(batch))
+
+                    # A failed submit only fails this batch -- the batcher thread has to keep running
+                    try:
+                        result = worker.submit(_RenderFrames, job, [alpha for alpha, _ in batch])
+                    except Exception as e:
+                        self._Release(worker, len(batch))
+                        if isinstance(e, BrokenProcessPool):
+                            self.replaceWorker(worker)
+                        self._Fail(batch, e)
+                        continue
+
+                    result.add_done_callback(lambda result, worker=worker, batch=batch: self._Resolve(result, worker, batch))
+
+    def replaceWorker(self, worker):
+
+        # Swap a broken executor for a fresh one unless another thread already has
+        with self.workerLock:
+            if worker in self.workers:
+                self.workers[self.workers.index(worker)] = self.createWorker()
+                self.load.pop(worker, None)
+                worker.shutdown(wait=False)
+
+    def _Acquire(self, home, frames):
+
+        # Least loaded worker -- ties go to the morph's usual worker so an idle service keeps one warm copy
+        with self.workerLock:
+            count = len(self.workers)
+            worker = min((self.workers[(home + i) % count] for i in range(count)), key=lambda worker: self.load.get(worker, 0))
+            self.load[worker] = self.load.get(worker, 0) + frames
+
+        return worker
+
+    def _Release(self, worker, frames):
+
+        with self.workerLock:
+            if worker in self.load:
+                self.load[worker] -= frames
+                if self.load[worker] <= 0:
+                    del self.load[worker]
+
+    def _Resolve(self, result, worker, batch):
+
+        self._Release(worker, len(batch))
+
+        if result.exception() is not None:
+            if isinstance(result.exception(), BrokenProcessPool):
+                self.replaceWorker(worker)
+            self._Fail(batch, result.exception())
+            return
+
+        for frame, (_, future) in zip(result.result(), batch):
+            future.set_result(frame)
+
+    def _Fail(self, batch, exception):
+
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exception)
+
+
+
+class MorphService():
+
+    daemon_threads = True
+
+    def _StartService(self, workers, cacheSize, batchWindow, frameTimeout, outputRoot):
+
+        # Sequences may only be written below this folder
+        self.outputRoot = os.path.realpath(outputRoot or os.getcwd())
+
+        # One single process executor per worker so morphs can be routed to a warm worker
+        self.cacheSize = cacheSize
+        self.frameTimeout = frameTimeout
+        self.workers = [self._CreateWorker() for _ in range(workers or os.cpu_count() or 1)]
+        self.batcher = FrameBatcher(self.workers, self._CreateWorker, window=batchWindow)
+
+        # File digests keyed by path, modification time and size -- bounded to what the workers can keep warm
+        self.digests = OrderedDict()
+        self.digestLimit = 4 * cacheSize * len(self.workers)
+        self.digestLock = threading.Lock()
+
+    def createJob(self, request):
+
+        job = {name: os.path.abspath(request[name]) for name in ('startImage', 'startPoints', 'endImage', 'endPoints')}
+        job['key'] = hashlib.sha1(''.join(self._FileDigest(job[name]) for name in ('startImage', 'startPoints', 'endImage', 'endPoints')).encode()).hexdigest()
+
+        # Optional reduced output -- (width, height) or a scale factor
+        job['outputSize'] = tuple(int(value) for value in request['outputSize']) if request.get('outputSize') is not None else None
+        job['scale'] = float(request['scale']) if request.get('scale') is not None else None
+
+        return job
+
+    def renderFrame(self, job, alpha):
+
+        # Never wait forever on a worker -- the handler turns a timeout into a 503
+        return self.batcher.submit(job, alpha).result(timeout=self.frameTimeout)
+
+    def renderSequence(self, job, targetFolderPath, alphas):
+
+        # Resolve links first so a path can't climb out of the output root
+        targetFolderPath = os.path.realpath(targetFolderPath)
+        if os.path.commonpath([self.outputRoot, targetFolderPath]) != self.outputRoot:
+            raise PermissionError("Sequences must be written below {}.".format(self.outputRoot))
+
+        if not os.path.exists(targetFolderPath):
+            os.makedirs(targetFolderPath, exist_ok=True)
+
+        fileNames = [os.path.join(targetFolderPath, 'frame{:03d}.jpg'.format(i + 1)) for i in range(len(alphas))]
+
+        # Split the sequence into contiguous chunks across every worker
+        workers = list(self.workers)
+        bounds = np.linspace(0, len(alphas), min(len(workers), len(alphas)) + 1).astype(int)
+
+        # Submit every chunk first so they render in parallel
+        results = []
+        for i, worker in enumerate(workers[:len(bounds) - 1]):
+            try:
+                results.append((worker, worker.submit(_RenderSequence, job, alphas[bounds[i]:bounds[i + 1]], fileNames[bounds[i]:bounds[i + 1]])))
+            except BrokenProcessPool as e:
+                results.append((worker, e))
+
+        # Replace whichever workers died so later requests get a healthy pool
+        written, broken = [], None
+        for worker, result in results:
+            try:
+                if isinstance(result, BrokenProcessPool):
+                    raise result
+                written.extend(result.result())
+            except BrokenProcessPool as e:
+                self.batcher.replaceWorker(worker)
+                broken = e
+
+        if broken is not None:
+            raise broken
+
+        return written
+
+    def server_close(self):
+
+        super().server_close()
+
+        for worker in self.workers:
+            worker.shutdown()
+
+    def _CreateWorker(self):
+
+        return ProcessPoolExecutor(max_workers=1, initializer=_InitWorker, initargs=(self.cacheSize,))
+
+    def _FileDigest(self, path):
+
+        stat = os.stat(path)
+        statKey = (path, stat.st_mtime_ns, stat.st_size)
+
+        # Most recently used digests live at the end
+        with self.digestLock:
+            digest = self.digests.pop(statKey, None)
+            if digest is not None:
+                self.digests[statKey] = digest
+
+        if digest is None:
+            with open(path, 'rb') as file:
+                digest = hashlib.sha1(file.read()).hexdigest()
+
+            with self.digestLock:
+                while len(self.digests) >= self.digestLimit:
+                    self.digests.popitem(last=False)
+                self.digests[statKey] = digest
+
+        return digest
+
+
+
+class MorphServer(MorphService, ThreadingHTTPServer):
+
+    def __init__(self, host = '127.0.0.1', port = 8765, workers = None, cacheSize = 8, batchWindow = 0.01, frameTimeout = 60.0, outputRoot = None):
+
+        ThreadingHTTPServer.__init__(self, (host, port), MorphRequestHandler)
+        self._StartService(workers, cacheSize, batchWindow, frameTimeout, outputRoot)
+
+
+
+class UnixMorphServer(MorphService, socketserver.ThreadingUnixStreamServer):
+
+    def __init__(self, socketPath, workers = None, cacheSize = 8, batchWindow = 0.01, frameTimeout = 60.0, outputRoot = None):
+
+        # Only a stale socket is cleared -- never a regular file
+        if os.path.exists(socketPath) and stat.S_ISSOCK(os.stat(socketPath).st_mode):
+            os.unlink(socketPath)
+
+        socketserver.ThreadingUnixStreamServer.__init__(self, socketPath, MorphRequestHandler)
+        os.chmod(socketPath, 0o600)
+        self._StartService(workers, cacheSize, batchWindow, frameTimeout, outputRoot)
+
+    def server_close(self):
+
+        super().server_close()
+
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+
+class MorphRequestHandler(BaseHTTPRequestHandler):
+
+    # Browsers never send these Host values for other sites, which also stops DNS rebinding
+    loopbackHosts = ('localhost', '127.0.0.1', '[::1]')
+
+    def do_GET(self):
+
+        if not self._IsLocal():
+            return
+
+        if self.path != '/status':
+            self._SendJson(404, {'error': "Unknown path {}.".format(self.path)})
+            return
+
+        self._SendJson(200, {'workers': len(self.server.workers)})
+
+    def do_POST(self):
+
+        if not self._IsLocal():
+            return
+
+        # A page can only send JSON after a CORS preflight, which is never answered
+        if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            self._SendJson(415, {'error': "Requests must be application/json."})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            job = self.server.createJob(request)
+
+            if self.path == '/frame':
+                frame = self.server.renderFrame(job, float(request['alpha']))
+                self._Send(200, 'image/png', frame)
+            elif self.path == '/sequence':
+                alphas = request.get('alphas')
+                if alphas is None:
+                    alphas = np.linspace(0.0, 1.0, int(request['sequenceLength'])).tolist()
+
+                fileNames = self.server.renderSequence(job, os.path.abspath(request['targetFolderPath']), [float(alpha) for alpha in alphas])
+                self._SendJson(200, {'files': fileNames})
+            else:
+                self._SendJson(404, {'error': "Unknown path {}.".format(self.path)})
+        except (FuturesTimeoutError, BrokenProcessPool) as e:
+            # Checked first -- the futures timeout is an OSError on recent Pythons
+            self._SendJson(503, {'error': str(e) or "Timed out waiting for a render worker."})
+        except PermissionError as e:
+            self._SendJson(403, {'error': str(e)})
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            self._SendJson(400, {'error': str(e)})
+        except Exception as e:
+            self._SendJson(500, {'error': str(e)})
+
+    def _IsLocal(self):
+
+        # Only local tools may call the service -- any page a browser loads sends an Origin
+        host = self.headers.get('Host', '').lower()
+
+        # Drop the port -- IPv6 hosts are bracketed
+        if host.startswith('['):
+            host = host[:host.find(']') + 1]
+        else:
+            host = host.split(':')[0]
+
+        if self.headers.get('Origin') is not None or host not in self.loopbackHosts:
+            self._SendJson(403, {'error': "Only local clients without an Origin may use this service."})
+            return False
+
+        return True
+
+    def log_message(self, format, *args):
+
+        # Keep the console quiet -- a frame request per line is too noisy
+        pass
+
+    def _SendJson(self, status, content):
+
+        self._Send(status, 'application/json', json.dumps(content).encode())
+
+    def _Send(self, status, contentType, body):
+
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+
+class _UnixConnection(HTTPConnection):
+
+    def __init__(self, socketPath, timeout = None):
+
+        # Host header stays on loopback so the server accepts it
+        super().__init__('localhost', timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socketPath)
+
+
+
+class MorphClient():
+
+    def __init__(self, host = '127.0.0.1', port = 8765, socketPath = None):
+
+        # A socket path takes precedence over host and port
+        self.host = host
+        self.port = port
+        self.socketPath = socketPath
+
+    def getBlendedImage(self, startImage, startPoints, endImage, endPoints, alpha, outputSize = None, scale = None):
+
+        # Arguments are file paths -- the service decodes and caches them
+        body = self._Post('/frame', self._Job(startImage, startPoints, endImage, endPoints, alpha=alpha, outputSize=outputSize, scale=scale))
+        return np.array(Image.open(BytesIO(body)))
+
+    def generateSequence(self, startImage, startPoints, endImage, endPoints, targetFolderPath, sequenceLength = None, alphas = None, outputSize = None, scale = None):
+
+        job = self._Job(startImage, startPoints, endImage, endPoints, targetFolderPath=os.path.abspath(targetFolderPath), outputSize=outputSize, scale=scale)
+
+        if alphas is not None:
+            job['alphas'] = [float(alpha) for alpha in alphas]
+        else:
+            job['sequenceLength'] = sequenceLength
+
+        return json.loads(self._Post('/sequence', job))['files']
+
+    def _Job(self, startImage, startPoints, endImage, endPoints, **kwargs):
+
+        job = {'startImage': os.path.abspath(startImage),
+               'startPoints': os.path.abspath(startPoints),
+               'endImage': os.path.abspath(endImage),
+               'endPoints': os.path.abspath(endPoints)}
+        job.update(kwargs)
+
+        return job
+
+    def _Post(self, path, content):
+
+        if self.socketPath is not None:
+            connection = _UnixConnection(self.socketPath)
+        else:
+            connection = HTTPConnection(self.host, self.port)
+
+        try:
+            connection.request('POST', path, body=json.dumps(content).encode(), headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+
+        if response.status != 200:
+            raise ValueError(json.loads(body).get('error', response.reason))
+
+        return body
+
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Serve morph frames from warm blenders over localhost HTTP or a Unix socket.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', default=None, help="Serve on this Unix socket instead of host and port.")
+    parser.add_argument('--output-root', default=None, help="Folder sequences may be written below -- defaults to the working folder.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes -- defaults to one per core.")
+    parser.add_argument('--cache', type=int, default=8, help="Prepared morphs kept warm per worker.")
+    parser.add_argument('--window', type=float, default=0.01, help="Seconds to wait for frame requests to batch together.")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Seconds a frame request waits for its worker.")
+    args = parser.parse_args()
+
+    options = dict(workers=args.workers, cacheSize=args.cache, batchWindow=args.window, frameTimeout=args.timeout, outputRoot=args.output_root)
+    if args.socket is not None:
+        server = UnixMorphServer(args.socket, **options)
+    else:
+        server = MorphServer(args.host, args.port, **options)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()